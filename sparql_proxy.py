@@ -0,0 +1,375 @@
+#!/usr/bin/python3
+"""
+SPARQL-SEArch caching proxy
+Lightweight shared caching proxy for SPARQL endpoints, so that a team
+does not send the same queries to public endpoints over and over again.
+
+Upstream endpoint is either the default one (--upstream) or it is part of the path,
+for example Sparql Search custom endpoint
+    http://localhost:8890/https://sparql.uniprot.org
+sends all queries through the proxy to UniProt. Only the default upstream, endpoints
+built into Sparql Search and ones added with --allow can be used. Cache statistics are at /stats.
+SPARQL updates are forwarded as they are, without caching, and clear cached responses of their upstream.
+"""
+
+__version__ = "1.0.0"
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Headers forwarded to the upstream endpoint
+FORWARDED_HEADERS = ("accept", "content-type", "user-agent")
+
+# Endpoints built into Sparql Search, which can always be used as upstreams
+KNOWN_ENDPOINTS = (
+    "http://dbpedia.org/sparql",
+    "http://id.nlm.nih.gov/mesh",
+    "https://bgee.org/sparql",
+    "https://sparql.uniprot.org",
+    "http://sparql.bioontology.org",
+    "http://uriburner.com/sparql",
+    "https://api.nextprot.org/sparql",
+)
+
+# Maximum size of a request body in bytes
+MAX_BODY_SIZE = 1024*1024
+
+# Request rate limits for upstream hosts as (requests per second, burst)
+UPSTREAM_RATES = {
+    "sparql.uniprot.org": (2, 4),
+}
+DEFAULT_UPSTREAM_RATE = (10, 20)
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 502: "Bad Gateway"}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Constructor
+        :param rate Tokens added per second
+        :param burst Maximum amount of tokens
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Waits until a token is available and takes it
+        """
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ResponseCache:
+    """
+    LRU cache of upstream responses with expiration
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=256*1024*1024, ttl=3600):
+        """
+        Constructor
+        :param max_entries Maximum amount of cached responses
+        :param max_bytes Maximum size of all cached bodies
+        :param ttl Seconds after which a response expires
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        """
+        Returns cached response or None
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, response):
+        """
+        Stores response, evicting least recently used ones when full
+        """
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.size += len(response[2])
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        """
+        Removes entry from the cache
+        """
+        _, response = self.entries.pop(key)
+        self.size -= len(response[2])
+
+    def remove_upstream(self, upstream):
+        """
+        Removes all responses of an upstream
+        """
+        for key in [k for k in self.entries if k[0] == upstream]:
+            self.remove(key)
+
+
+class SPARQLProxy:
+    """
+    Caching proxy speaking the SPARQL protocol
+    """
+
+    def __init__(self, upstream, cache=None, timeout=60, workers=16, allowed=()):
+        """
+        Constructor
+        :param upstream Default upstream endpoint
+        :param cache ResponseCache used for responses
+        :param timeout Timeout of upstream requests in seconds
+        :param workers Maximum of concurrent upstream requests
+        :param allowed Upstream endpoints allowed besides the default and known ones
+        """
+        self.upstream = upstream
+        self.allowed = {x.rstrip("/") for x in (upstream,) + KNOWN_ENDPOINTS + tuple(allowed)}
+        self.cache = cache if cache is not None else ResponseCache()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.in_flight = {}
+        self.buckets = {}
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "coalesced": 0, "updates": 0,
+                      "errors": 0, "bytes_served": 0, "upstreams": {}}
+
+    def bucket(self, host):
+        """
+        Returns rate limiter of an upstream host
+        """
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(*UPSTREAM_RATES.get(host, DEFAULT_UPSTREAM_RATE))
+        return self.buckets[host]
+
+    def upstream_stats(self, upstream):
+        """
+        Returns statistics of one upstream
+        """
+        return self.stats["upstreams"].setdefault(upstream, {"requests": 0, "errors": 0,
+                                                             "bytes": 0, "time": 0.0})
+
+    def get_stats(self):
+        """
+        Returns proxy statistics
+        """
+        stats = dict(self.stats)
+        stats["cache_entries"] = len(self.cache.entries)
+        stats["cache_bytes"] = self.cache.size
+        stats["in_flight"] = len(self.in_flight)
+        return stats
+
+    def split_target(self, target):
+        """
+        Splits request target into upstream url and query parameters
+        """
+        parts = urlsplit(target)
+        path = parts.path.lstrip("/")
+        if path.startswith("http:/") or path.startswith("https:/"):
+            # Some clients squash // in paths
+            scheme, rest = path.split(":/", 1)
+            upstream = scheme + "://" + rest.lstrip("/")
+        else:
+            upstream = self.upstream
+        return upstream, parse_qsl(parts.query, keep_blank_values=True)
+
+    def is_update(self, params, headers, body):
+        """
+        Checks if request is a SPARQL update, which must not be cached
+        """
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("application/sparql-update"):
+            return True
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            params = params + parse_qsl(body.decode("utf-8"), keep_blank_values=True)
+        return any(name == "update" for name, _ in params)
+
+    def cache_key(self, upstream, params, headers, body):
+        """
+        Creates cache key of a request
+        GET and POST forms of the same query share the key.
+        """
+        content_type = headers.get("content-type", "")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            params = params + parse_qsl(body.decode("utf-8"), keep_blank_values=True)
+            body = b""
+        elif content_type.startswith("application/sparql-query"):
+            params = params + [("query", body.decode("utf-8"))]
+            body = b""
+        return (upstream, tuple(sorted(params)), headers.get("accept", ""), body)
+
+    def fetch(self, upstream, method, params, headers, body):
+        """
+        Sends request to upstream, this is run in executor thread
+        :return Tuple of status, content type and body
+        """
+        url = upstream
+        if params:
+            url += ("&" if "?" in url else "?") + urlencode(params)
+        request = urllib.request.Request(url, data=body if method == "POST" else None, method=method,
+                                         headers={k: v for k, v in headers.items() if k in FORWARDED_HEADERS})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return (response.status, response.headers.get("Content-Type", "text/plain"), response.read())
+        except urllib.error.HTTPError as e:
+            return (e.code, e.headers.get("Content-Type", "text/plain"), e.read())
+
+    async def query_upstream(self, upstream, method, params, headers, body):
+        """
+        Sends request upstream respecting its rate limit
+        """
+        stats = self.upstream_stats(upstream)
+        await self.bucket(urlsplit(upstream).hostname).acquire()
+        start = time.monotonic()
+        stats["requests"] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self.executor, self.fetch, upstream, method, params, headers, body)
+        except Exception as e:
+            print("Upstream ", upstream, " failed: ", e, file=sys.stderr)
+            response = (502, "text/plain", str(e).encode("utf-8"))
+        stats["time"] += time.monotonic() - start
+        stats["bytes"] += len(response[2])
+        if response[0] != 200:
+            stats["errors"] += 1
+        return response
+
+    async def handle_query(self, method, target, headers, body):
+        """
+        Answers SPARQL request from cache or upstream
+        Identical queries running at the same time are sent upstream only once.
+        """
+        upstream, params = self.split_target(target)
+        if upstream.rstrip("/") not in self.allowed:
+            return (403, "text/plain", ("Upstream "+upstream+" is not allowed").encode("utf-8"))
+        if self.is_update(params, headers, body):
+            # Updates change data, so each one is sent and cached queries of the upstream are outdated
+            self.stats["updates"] += 1
+            response = await self.query_upstream(upstream, method, params, headers, body)
+            self.cache.remove_upstream(upstream)
+            return response
+        key = self.cache_key(upstream, params, headers, body)
+        response = self.cache.get(key)
+        if response is not None:
+            self.stats["hits"] += 1
+            return response
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self.in_flight[key])
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            response = await self.query_upstream(upstream, method, params, headers, body)
+            if response[0] == 200:
+                self.cache.put(key, response)
+            future.set_result(response)
+        except BaseException as e:
+            future.set_exception(e)
+            # Do not report the exception as never retrieved
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+        return response
+
+    async def handle(self, reader, writer):
+        """
+        Handles one client connection
+        """
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            if len(request_line) != 3:
+                return
+            method, target, _ = request_line
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", "\n", ""):
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            body = b"" if length > MAX_BODY_SIZE else await reader.readexactly(length)
+            self.stats["requests"] += 1
+            if length > MAX_BODY_SIZE:
+                response = (413, "text/plain", b"Request body is too large")
+            elif urlsplit(target).path == "/stats":
+                response = (200, "application/json", json.dumps(self.get_stats()).encode("utf-8"))
+            elif method not in ("GET", "POST"):
+                response = (405, "text/plain", b"Only GET and POST are supported")
+            else:
+                response = await self.handle_query(method, target, headers, body)
+            if response[0] != 200:
+                self.stats["errors"] += 1
+            status, content_type, data = response
+            writer.write("HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+                status, STATUS_TEXT.get(status, ""), content_type, len(data)).encode("latin-1"))
+            writer.write(data)
+            self.stats["bytes_served"] += len(data)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            print("Bad request: ", e, file=sys.stderr)
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8890):
+        """
+        Runs the proxy server
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        print("Proxy for ", self.upstream, " listening on http://{}:{}".format(host, port), file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caching proxy for SPARQL endpoints.")
+    parser.add_argument("--upstream", default="http://dbpedia.org/sparql",
+                        help="endpoint used when it is not part of the request path")
+    parser.add_argument("--allow", action="append", default=[], metavar="URL",
+                        help="allow another upstream endpoint, can be used multiple times")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8890, help="port to listen on")
+    parser.add_argument("--ttl", type=int, default=3600, help="seconds for which responses are cached")
+    parser.add_argument("--max-entries", type=int, default=10000, help="maximum of cached responses")
+    parser.add_argument("--max-mb", type=int, default=256, help="maximum size of cache in MB")
+    parser.add_argument("--timeout", type=int, default=60, help="upstream timeout in seconds")
+    args = parser.parse_args()
+    cache = ResponseCache(args.max_entries, args.max_mb*1024*1024, args.ttl)
+    proxy = SPARQLProxy(args.upstream, cache, args.timeout, allowed=args.allow)
+    try:
+        asyncio.run(proxy.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
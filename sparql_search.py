@@ -10,6 +10,21 @@ __version__ = "1.0.0"
 __email__ = ("xsedla1b@fit.vutbr.cz", "mr.mareksedlacek@gmail.com")
 
 import sys
+import os
+import io
+import csv
+import json
+import time
+import argparse
+import urllib.error
+import threading
+import re
+import html
+import gzip
+import zlib
+import itertools
+from collections import OrderedDict
+from concurrent.futures import Future
 from PyQt5 import QtWidgets
 from PyQt5 import QtCore
 from PyQt5.QtCore import Qt
@@ -23,12 +38,254 @@ from PyQt5.QtWidgets import (QHBoxLayout, QMainWindow,
                              QComboBox, QVBoxLayout,
                              QTextBrowser,
                              QMessageBox,
+                             QCheckBox,
+                             QFileDialog,
                              )
 from PyQt5.QtGui import QIntValidator
 
-from SPARQLWrapper import SPARQLWrapper, JSON
+from SPARQLWrapper import SPARQLWrapper, JSON, CSV, TSV
+from SPARQLWrapper.SPARQLExceptions import QueryBadFormed
 
 
+# Result formats of SELECT queries, formats in TYPED_RESULT_FORMATS keep term types and languages
+RESULT_FORMATS = {"json": JSON, "tsv": TSV, "csv": CSV}
+TYPED_RESULT_FORMATS = ("json", "tsv")
+# Part of the response Content-Type expected for a format
+RESULT_CONTENT_TYPES = {"json": "json", "tsv": "text/tab-separated-values", "csv": "text/csv"}
+# Amount of queries returning rows measured in each format before choosing the cheapest
+NEGOTIATION_SAMPLES = 3
+
+class ResultFormatError(Exception):
+    """
+    Endpoint did not return results in requested format
+    """
+
+class FormatNegotiator:
+    """
+    Picks the cheapest result format for each endpoint and query shape
+    Every format is first measured a few times on queries of the same shape,
+    then the one with the lowest transfer and parsing time per row is used.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.unsupported = {}
+
+    def choose(self, endpoint, shape, typed=False):
+        """
+        Returns format to be used for a query to endpoint
+        :param shape Name of the kind of query, only queries of one shape are compared
+        :param typed If True only formats keeping term types are considered
+        """
+        with self.lock:
+            unsupported = self.unsupported.get(endpoint, set())
+            candidates = [f for f in (TYPED_RESULT_FORMATS if typed else RESULT_FORMATS) if f not in unsupported]
+            if len(candidates) == 0:
+                return "json"
+            stats = self.stats.setdefault(endpoint, {}).setdefault(shape, {})
+            for fmt in candidates:
+                if fmt not in stats or stats[fmt]["samples"] < NEGOTIATION_SAMPLES:
+                    return fmt
+            # Bandwidth of the endpoint measured over all formats
+            bandwidth = sum(x["bytes"] for x in stats.values()) / max(sum(x["fetch_time"] for x in stats.values()), 1e-6)
+            return min(candidates, key=lambda f: (stats[f]["bytes"]/bandwidth + stats[f]["parse_time"]) / stats[f]["rows"])
+
+    def record(self, endpoint, shape, fmt, rows, size, fetch_time, parse_time):
+        """
+        Records measurement of one query
+        """
+        if rows == 0:
+            return
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, {}).setdefault(shape, {}).setdefault(
+                fmt, {"samples": 0, "rows": 0, "bytes": 0, "fetch_time": 0.0, "parse_time": 0.0})
+            stats["samples"] += 1
+            stats["rows"] += rows
+            stats["bytes"] += size
+            stats["fetch_time"] += fetch_time
+            stats["parse_time"] += parse_time
+
+    def set_unsupported(self, endpoint, fmt):
+        """
+        Marks format as not working with endpoint
+        """
+        with self.lock:
+            self.unsupported.setdefault(endpoint, set()).add(fmt)
+
+    def get_stats(self):
+        """
+        Returns bytes and parse time per row of each format for each endpoint and query shape
+        """
+        with self.lock:
+            return {endpoint: {shape: {fmt: {"bytes_per_row": x["bytes"] / x["rows"],
+                                             "parse_us_per_row": 1e6 * x["parse_time"] / x["rows"]}
+                                       for fmt, x in formats.items()}
+                               for shape, formats in shapes.items()}
+                    for endpoint, shapes in self.stats.items()}
+
+negotiator = FormatNegotiator()
+
+TSV_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f"}
+TSV_ESCAPE_RE = re.compile(r"\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)")
+CSV_VARIABLE_RE = re.compile(r"^[A-Za-z0-9_]+$")
+
+def unescape_tsv(match):
+    """
+    Returns character of one escape sequence in TSV results
+    """
+    escape = match.group(1)
+    if len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    return TSV_ESCAPES.get(escape, escape)
+
+def parse_tsv_term(term):
+    """
+    Parses RDF term from TSV results into SPARQL JSON results form
+    """
+    if term[0] == "<":
+        return {"type": "uri", "value": term[1:-1]}
+    if term[:2] == "_:":
+        return {"type": "bnode", "value": term[2:]}
+    if term[0] in "\"'":
+        end = term.rindex(term[0])
+        value = term[1:end]
+        if "\\" in value:
+            value = TSV_ESCAPE_RE.sub(unescape_tsv, value)
+        suffix = term[end+1:]
+        if suffix[:1] == "@":
+            return {"type": "literal", "value": value, "xml:lang": suffix[1:]}
+        if suffix[:2] == "^^":
+            return {"type": "literal", "value": value, "datatype": suffix[3:-1]}
+        return {"type": "literal", "value": value}
+    # Numbers and booleans can be written without quotes
+    if term in ("true", "false"):
+        datatype = "boolean"
+    elif "e" in term or "E" in term:
+        datatype = "double"
+    elif "." in term:
+        datatype = "decimal"
+    else:
+        datatype = "integer"
+    return {"type": "literal", "value": term, "datatype": "http://www.w3.org/2001/XMLSchema#"+datatype}
+
+def parse_tsv_results(text):
+    """
+    Parses SPARQL TSV results into bindings
+    Unbound variables are empty fields, so a row with no bound variable is an empty line.
+    """
+    lines = text.split("\n")
+    if len(lines) > 1 and lines[-1] == "":
+        # Newline ending the last row
+        lines.pop()
+    header = [x.strip() for x in lines[0].split("\t")]
+    if any(x[:1] != "?" or len(x) < 2 for x in header):
+        raise ResultFormatError("TSV results do not start with variables")
+    names = [x[1:] for x in header]
+    bindings = []
+    for line in lines[1:]:
+        line = line.rstrip("\r")
+        bindings.append({name: parse_tsv_term(term) for name, term in zip(names, line.split("\t")) if len(term) > 0})
+    return bindings
+
+def parse_csv_results(text):
+    """
+    Parses SPARQL CSV results into bindings
+    CSV does not keep term types, so values that look like iris are taken as uris.
+    Empty and unbound values cannot be told apart, every variable gets a value, empty ones are literals "".
+    """
+    rows = csv.reader(io.StringIO(text))
+    names = next(rows, [])
+    if len(names) == 0 or not all(CSV_VARIABLE_RE.match(x) for x in names):
+        raise ResultFormatError("CSV results do not start with variables")
+    return [{name: {"type": "uri" if value[:7] in ("http://", "https:/") or value[:4] == "urn:" else "literal",
+                    "value": value}
+             for name, value in zip(names, row + [""]*len(names))}
+            for row in rows]
+
+def decompress(raw, encoding):
+    """
+    Decompresses response body by its Content-Encoding
+    Some servers send deflate without the zlib header, so raw deflate is tried as well.
+    """
+    if encoding == "gzip":
+        return gzip.decompress(raw)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(raw)
+        except zlib.error:
+            return zlib.decompress(raw, -zlib.MAX_WBITS)
+    return raw
+
+def fetch_select(sparql, fmt):
+    """
+    Runs SELECT query requesting results in fmt with compressed transfer
+    :return Tuple of bindings, transferred bytes, fetch time and parse time
+    :raise ResultFormatError when endpoint does not support fmt
+    :raise urllib.error.URLError when compressed response cannot be decompressed
+    """
+    sparql.setReturnFormat(RESULT_FORMATS[fmt])
+    sparql.addCustomHttpHeader("Accept-Encoding", "gzip, deflate")
+    start = time.perf_counter()
+    try:
+        response = sparql.query().response
+    except QueryBadFormed as e:
+        if fmt == "json":
+            raise
+        raise ResultFormatError(str(e))
+    except urllib.error.HTTPError as e:
+        if fmt == "json" or e.code != 406:
+            raise
+        raise ResultFormatError(str(e))
+    raw = response.read()
+    fetched = time.perf_counter()
+    info = response.info()
+    encoding = info.get("Content-Encoding", "")
+    try:
+        data = decompress(raw, encoding)
+    except (OSError, EOFError, zlib.error) as e:
+        # Broken transfer, not an unsupported format
+        raise urllib.error.URLError("Could not decompress "+encoding+" response: "+str(e))
+    if fmt == "json":
+        bindings = json.loads(data)["results"]["bindings"]
+    else:
+        content_type = info.get("Content-Type", "")
+        if RESULT_CONTENT_TYPES[fmt] not in content_type:
+            raise ResultFormatError("Expected "+fmt+" results, got "+content_type)
+        try:
+            text = data.decode("utf-8")
+            if fmt == "tsv":
+                bindings = parse_tsv_results(text)
+            else:
+                bindings = parse_csv_results(text)
+        except (ValueError, IndexError, csv.Error) as e:
+            raise ResultFormatError(str(e))
+    return (bindings, len(raw), fetched - start, time.perf_counter() - fetched)
+
+def run_select(sparql, shape, typed=False):
+    """
+    Runs SELECT query in the cheapest result format for the endpoint
+    When endpoint does not support the format, query is repeated in JSON.
+    Network errors and timeouts are raised as they are.
+    :param shape Name of the kind of query, formats are compared on queries of one shape
+    :param typed If True, results have to keep term types and languages
+    :return List of bindings in SPARQL JSON results form
+    """
+    fmt = negotiator.choose(sparql.endpoint, shape, typed)
+    try:
+        bindings, size, fetch_time, parse_time = fetch_select(sparql, fmt)
+    except ResultFormatError as e:
+        print("Format ", fmt, " does not work with ", sparql.endpoint, ": ", e, file=sys.stderr)
+        bindings, size, fetch_time, parse_time = fetch_select(sparql, "json")
+        # Only when JSON works the query itself was fine
+        negotiator.set_unsupported(sparql.endpoint, fmt)
+        fmt = "json"
+    negotiator.record(sparql.endpoint, shape, fmt, len(bindings), size, fetch_time, parse_time)
+    return bindings
+
 def search_dbpedia(sparql, keyword, limit=10, offset=0, timeout=100000):
     """
     Does advanced search in dbpedia
@@ -47,32 +304,29 @@ def search_dbpedia(sparql, keyword, limit=10, offset=0, timeout=100000):
                             }}
                         }}
                     }}
-                    order by desc (?sc * 3e-1 + sql:rnk_scale (<LONG::IRI_RANK> (?s1)))  limit {1}  offset {2} 
+                    order by desc (?sc * 3e-1 + sql:rnk_scale (<LONG::IRI_RANK> (?s1))) ?s1  limit {1}  offset {2} 
                 }}
             }}
         }}
     """.format(keyword, limit, offset))
-    sparql.setReturnFormat(JSON)
     sparql.setTimeout(timeout)
     sparql.addExtraURITag("timeout", str(timeout))
-    return sparql.query().convert()["results"]["bindings"]
+    return run_select(sparql, "search_dbpedia")
 
-def search_general_db(sparql, keyword, limit=10, offset=0, timeout=10000):
+def search_general_db(sparql, keyword, limit=10, offset=0, timeout=10000, ordered=False):
     """
     Does a search in general sparql db based on a keyword
+    :param ordered If True, results are sorted, so that pages do not overlap
     """
     sparql.setQuery("""
         SELECT DISTINCT ?c1 ?p1 ?o1 WHERE {{
             ?c1 ?p1 ?o1 
             filter contains(str(?c1),"{}")
-        }} LIMIT {} OFFSET {}
-    """.format(keyword, limit, offset))
-    sparql.setReturnFormat(JSON)
+        }} {}LIMIT {} OFFSET {}
+    """.format(keyword, "ORDER BY ?c1 ?p1 ?o1 " if ordered else "", limit, offset))
     sparql.setTimeout(timeout)
     sparql.addExtraURITag("timeout", str(timeout))
-    print(sparql.query().convert()["results"])
-    return sparql.query().convert()["results"]["bindings"]
-    pass
+    return run_select(sparql, "search_general_db")
 
 def get_dbpedia_info(sparql, uri, limit=10, offset=0, lang="en"):
     """
@@ -88,24 +342,30 @@ def get_dbpedia_info(sparql, uri, limit=10, offset=0, lang="en"):
             FILTER(LANG(?desc) = "{}")
         }} LIMIT {} OFFSET {}
     """.format(uri, lang, limit, offset))
-    sparql.setReturnFormat(JSON)
-    all_res = sparql.query().convert()["results"]["bindings"]
+    all_res = run_select(sparql, "get_dbpedia_info")
     if len(all_res) == 0:
         return (uri, format_uri(uri), "", "")
     return (uri, all_res[0]["name"]["value"], all_res[0]["desc"]["value"], all_res[0]["wiki"]["value"])
 
-def get_all_triplets(sparql, uri, limit=10, offset=0):
+def get_triplet_bindings(sparql, uri, limit=10, offset=0, typed=True, ordered=False):
     """
-    Returns all triplets regarding some uri
+    Returns bindings of predicates and objects of all triplets regarding some uri
+    :param typed If True, objects keep their types and languages
+    :param ordered If True, triplets are sorted, so that pages do not overlap
     """
     sparql.setQuery("""
         SELECT DISTINCT *
         WHERE {{
             <{}> ?p ?o
-        }} LIMIT {} offset {}
-    """.format(uri, limit, offset))
-    sparql.setReturnFormat(JSON)
-    all_res = sparql.query().convert()["results"]["bindings"]
+        }} {}LIMIT {} offset {}
+    """.format(uri, "ORDER BY ?p ?o " if ordered else "", limit, offset))
+    return run_select(sparql, "get_triplet_bindings", typed)
+
+def get_all_triplets(sparql, uri, limit=10, offset=0):
+    """
+    Returns all triplets regarding some uri
+    """
+    all_res = get_triplet_bindings(sparql, uri, limit, offset, typed=False)
     return [(uri, x["p"]["value"], x["o"]["value"]) for x in all_res]
 
 def format_uri(uri):
@@ -118,18 +378,18 @@ def format_uri(uri):
     name = name.replace("#", ": ")
     return name
 
-def get_db_all(sparql, limit=10, offset=0):
+def get_db_all(sparql, limit=10, offset=0, ordered=False):
     """
     Returns top level data from db
+    :param ordered If True, subjects are sorted, so that pages do not overlap
     """
     sparql.setQuery("""
         SELECT DISTINCT ?s
         WHERE {{
             ?s ?p ?o
-        }} LIMIT {} offset {}
-    """.format(limit, offset))
-    sparql.setReturnFormat(JSON)
-    all_res = sparql.query().convert()["results"]["bindings"]
+        }} {}LIMIT {} offset {}
+    """.format("ORDER BY ?s " if ordered else "", limit, offset))
+    all_res = run_select(sparql, "get_db_all")
     return [(x["s"]["value"], format_uri(x["s"]["value"])) for x in all_res]
 
 def get_wiki_link(sparql, uri):
@@ -143,8 +403,7 @@ def get_wiki_link(sparql, uri):
             <{}> pref:isPrimaryTopicOf ?wiki
         }}
     """.format(uri))
-    sparql.setReturnFormat(JSON)
-    return sparql.query().convert()["results"]["bindings"][0]["wiki"]["value"]
+    return run_select(sparql, "get_wiki_link")[0]["wiki"]["value"]
 
 def get_description(sparql, uri, lang="en"):
     """
@@ -157,8 +416,7 @@ def get_description(sparql, uri, lang="en"):
             <{}> pref:abstract ?res
         }}
     """.format(uri))
-    sparql.setReturnFormat(JSON)
-    all_desc = sparql.query().convert()["results"]["bindings"]
+    all_desc = run_select(sparql, "get_description", typed=True)
     for value in all_desc:
         if value["res"]["xml:lang"] == lang:
             return value["res"]["value"]
@@ -174,8 +432,550 @@ def get_name(sparql, uri):
             <{}> pref:name ?name
         }}
     """.format(uri))
-    sparql.setReturnFormat(JSON)
-    return sparql.query().convert()["results"]["bindings"][0]["name"]["value"]
+    return run_select(sparql, "get_name")[0]["name"]["value"]
+
+def get_labels(sparql, uris, lang="en"):
+    """
+    Returns labels of multiple uris using one query
+    Labels in lang are preferred to ones without a language.
+    """
+    sparql.setQuery("""
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+        PREFIX skos: <http://www.w3.org/2004/02/skos/core#>
+        PREFIX foaf: <http://xmlns.com/foaf/0.1/>
+
+        SELECT ?uri ?label
+        WHERE {{
+            VALUES ?uri {{ {} }}
+            VALUES ?p {{ rdfs:label skos:prefLabel foaf:name }}
+            ?uri ?p ?label
+            FILTER(LANG(?label) = "{}" || LANG(?label) = "")
+        }}
+    """.format(" ".join("<"+x+">" for x in uris), lang))
+    labels = {}
+    for x in run_select(sparql, "get_labels", typed=True):
+        uri = x["uri"]["value"]
+        if uri not in labels or x["label"].get("xml:lang") == lang:
+            labels[uri] = x["label"]["value"]
+    return labels
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = ("interactive", "prefetch", "bulk")
+
+# Maximum of concurrent requests sent to one endpoint
+ENDPOINT_CONCURRENCY = {
+    "https://sparql.uniprot.org": 2,
+}
+DEFAULT_ENDPOINT_CONCURRENCY = 4
+
+# Request rate limits for endpoints as (requests per second, burst)
+ENDPOINT_RATES = {
+    "https://sparql.uniprot.org": (2, 4),
+}
+DEFAULT_ENDPOINT_RATE = (10, 20)
+
+class RequestScheduler:
+    """
+    Schedules all requests to endpoints by their priority
+    Interactive requests are always dispatched first. One worker thread and one
+    request slot and rate limit token of every endpoint are kept for them, so that
+    background work cannot make clicks wait.
+    Each endpoint has its own concurrency limit and token bucket rate limit.
+    """
+
+    def __init__(self, workers=8):
+        """
+        Constructor
+        :param workers Amount of threads sending requests
+        """
+        self.workers = workers
+        self.threads = []
+        self.cond = threading.Condition()
+        self.queue = []
+        self.seq = itertools.count()
+        self.running = {}
+        self.total_running = 0
+        self.buckets = {}
+        self.stats = [{"started": 0, "done": 0, "cancelled": 0, "wait": 0.0, "max_wait": 0.0} for _ in PRIORITY_NAMES]
+
+    def submit(self, endpoint, priority, func, *args):
+        """
+        Queues function sending a request to endpoint
+        :return Future with the function's result
+        """
+        future = Future()
+        with self.cond:
+            if len(self.threads) == 0:
+                for _ in range(self.workers):
+                    thread = threading.Thread(target=self.work, daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+            self.queue.append((priority, next(self.seq), time.monotonic(), endpoint, future, func, args))
+            self.cond.notify_all()
+        return future
+
+    def cancel_queued(self, priority, endpoint=None):
+        """
+        Cancels all queued requests with priority
+        :param endpoint If set only requests to this endpoint are cancelled
+        """
+        with self.cond:
+            for job in self.queue:
+                if job[0] == priority and (endpoint is None or job[3] == endpoint):
+                    job[4].cancel()
+            self.cond.notify_all()
+
+    def take_token(self, endpoint, now, reserve=0):
+        """
+        Takes token from endpoint's bucket
+        :param reserve Amount of tokens which have to stay in the bucket
+        :return 0 when token was taken, otherwise seconds until one is available
+        """
+        rate, burst = ENDPOINT_RATES.get(endpoint, DEFAULT_ENDPOINT_RATE)
+        tokens, updated = self.buckets.get(endpoint, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1 + reserve:
+            self.buckets[endpoint] = (tokens, now)
+            return (1 + reserve - tokens) / rate
+        self.buckets[endpoint] = (tokens - 1, now)
+        return 0
+
+    def next_job(self):
+        """
+        Removes the most important job that can run now from the queue
+        :return Job and None or None and seconds to wait for a job
+        """
+        now = time.monotonic()
+        delay = None
+        # Endpoints which have more important requests waiting
+        blocked = set()
+        for job in sorted(self.queue, key=lambda j: (j[0], j[1])):
+            priority, _, queued, endpoint, future, _, _ = job
+            if future.cancelled():
+                self.queue.remove(job)
+                self.stats[priority]["cancelled"] += 1
+                continue
+            if endpoint in blocked:
+                continue
+            background = priority != PRIORITY_INTERACTIVE
+            if background and self.total_running >= self.workers - 1:
+                # Last free worker is kept for interactive requests
+                continue
+            limit = ENDPOINT_CONCURRENCY.get(endpoint, DEFAULT_ENDPOINT_CONCURRENCY)
+            if background and limit > 1:
+                limit -= 1
+            if self.running.get(endpoint, 0) >= limit:
+                blocked.add(endpoint)
+                continue
+            burst = ENDPOINT_RATES.get(endpoint, DEFAULT_ENDPOINT_RATE)[1]
+            wait = self.take_token(endpoint, now, 1 if background and burst > 1 else 0)
+            if wait > 0:
+                blocked.add(endpoint)
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            self.queue.remove(job)
+            if not future.set_running_or_notify_cancel():
+                self.stats[priority]["cancelled"] += 1
+                continue
+            stats = self.stats[priority]
+            stats["started"] += 1
+            stats["wait"] += now - queued
+            stats["max_wait"] = max(stats["max_wait"], now - queued)
+            self.running[endpoint] = self.running.get(endpoint, 0) + 1
+            self.total_running += 1
+            return job, None
+        return None, delay
+
+    def work(self):
+        """
+        Worker thread loop
+        """
+        while True:
+            with self.cond:
+                job, delay = self.next_job()
+                while job is None:
+                    self.cond.wait(delay)
+                    job, delay = self.next_job()
+            priority, _, _, endpoint, future, func, args = job
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            with self.cond:
+                self.running[endpoint] -= 1
+                self.total_running -= 1
+                self.stats[priority]["done"] += 1
+                self.cond.notify_all()
+
+    def get_stats(self):
+        """
+        Returns queue depth, running requests and wait times for each priority
+        """
+        with self.cond:
+            result = {}
+            for priority, name in enumerate(PRIORITY_NAMES):
+                stats = self.stats[priority]
+                result[name] = {
+                    "queued": sum(1 for j in self.queue if j[0] == priority and not j[4].cancelled()),
+                    "done": stats["done"],
+                    "cancelled": stats["cancelled"],
+                    "avg_wait": stats["wait"] / max(stats["started"], 1),
+                    "max_wait": stats["max_wait"],
+                }
+            result["running"] = dict(self.running)
+            return result
+
+scheduler = RequestScheduler()
+
+EXPORT_FORMATS = ("jsonl", "csv", "nt")
+EXPORT_MODES = ("all", "search", "triplets")
+
+def export_fields(mode):
+    """
+    Returns names of columns exported for a mode
+    """
+    if mode == "triplets":
+        return ("subject", "predicate", "object")
+    return ("uri", "name")
+
+def fetch_export_page(endpoint, mode, limit, offset, keyword=None, uri=None, dbpedia=False, timeout=10000):
+    """
+    Fetches one page of rows for export
+    Rows are tuples of terms in SPARQL JSON results form, so types and languages are kept.
+    Every call uses its own SPARQLWrapper, since it is not safe to share one between threads.
+    Queries are sorted, otherwise endpoints may return pages fetched at once or after resume in different order.
+    :param dbpedia If True, search uses DBPedia full text search as the search view does
+    """
+    sparql = SPARQLWrapper(endpoint)
+    if mode == "all":
+        return [({"type": "uri", "value": x[0]}, {"type": "literal", "value": x[1]})
+                for x in get_db_all(sparql, limit, offset, ordered=True)]
+    elif mode == "search":
+        if dbpedia:
+            results = search_dbpedia(sparql, keyword, limit, offset, timeout)
+        else:
+            results = search_general_db(sparql, keyword, limit, offset, timeout, ordered=True)
+        return [(x["c1"], {"type": "literal", "value": format_uri(x["c1"]["value"])}) for x in results]
+    elif mode == "triplets":
+        return [({"type": "uri", "value": uri}, x["p"], x["o"])
+                for x in get_triplet_bindings(sparql, uri, limit, offset, ordered=True)]
+    raise ValueError("Unknown export mode "+str(mode))
+
+NT_IRI_ESCAPE_RE = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+NT_LITERAL_ESCAPES = {"\\": "\\\\", "\"": "\\\"", "\n": "\\n", "\r": "\\r"}
+NT_BNODE_RE = re.compile(r"[^A-Za-z0-9_-]")
+
+def nt_term(term):
+    """
+    Formats term in SPARQL JSON results form as N-Triples term
+    """
+    value = term["value"]
+    if term["type"] == "uri":
+        return "<"+NT_IRI_ESCAPE_RE.sub(lambda m: "\\u{:04X}".format(ord(m.group(0))), value)+">"
+    if term["type"] == "bnode":
+        return "_:"+NT_BNODE_RE.sub("_", value)
+    value = "".join(NT_LITERAL_ESCAPES.get(c, c) for c in value)
+    if "xml:lang" in term:
+        return "\""+value+"\"@"+term["xml:lang"]
+    if "datatype" in term:
+        return "\""+value+"\"^^"+nt_term({"type": "uri", "value": term["datatype"]})
+    return "\""+value+"\""
+
+def format_export_row(fmt, fields, row):
+    """
+    Formats one row of terms into a line in selected format
+    JSON Lines and CSV contain only values of the terms.
+    """
+    if fmt == "jsonl":
+        return json.dumps({field: term["value"] for field, term in zip(fields, row)}, ensure_ascii=False)+"\n"
+    elif fmt == "csv":
+        line = io.StringIO()
+        csv.writer(line).writerow([term["value"] for term in row])
+        return line.getvalue()
+    elif fmt == "nt":
+        return " ".join(nt_term(term) for term in row)+" .\n"
+    raise ValueError("Unknown export format "+str(fmt))
+
+def export_results(endpoint, path, fmt="jsonl", mode="all", keyword=None, uri=None, dbpedia=False,
+                   limit=100, workers=4, resume=False, timeout=10000, progress=None, stop=None):
+    """
+    Exports whole result set into a file, fetching several pages at once
+    Pages are requested as bulk work through the scheduler and written in order
+    as they arrive, at most workers of them are requested or kept in memory at once.
+    Progress is saved next to the output into path+".state", so an interrupted
+    export can continue with resume=True.
+    :param dbpedia If True, search mode uses DBPedia full text search
+    :param workers Maximum of concurrent requests of this export
+    :param progress Function called with (rows, bytes, rows/s, bytes/s) after each page
+    :param stop threading.Event, which stops the export once set
+    :return Tuple of exported rows and bytes
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError("Unknown export format "+str(fmt))
+    if mode not in EXPORT_MODES:
+        raise ValueError("Unknown export mode "+str(mode))
+    if fmt == "nt" and mode != "triplets":
+        raise ValueError("Only triplets of an uri can be exported as N-Triples")
+    if mode == "search" and not keyword:
+        raise ValueError("Search export needs a keyword")
+    if mode == "triplets" and not uri:
+        raise ValueError("Triplets export needs an uri")
+    fields = export_fields(mode)
+    state_path = path+".state"
+    # Export can be resumed only with the same parameters
+    params = {"endpoint": endpoint, "format": fmt, "mode": mode,
+              "keyword": keyword if mode == "search" else None, "uri": uri if mode == "triplets" else None,
+              "dbpedia": dbpedia if mode == "search" else None}
+    offset, rows, written = 0, 0, 0
+    if resume and os.path.exists(state_path) and os.path.exists(path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if state.get("params") != params:
+            raise ValueError("Export in "+path+" was started with different parameters "+str(state.get("params")))
+        offset, rows, written = state["offset"], state["rows"], state["bytes"]
+    out = open(path, "r+b" if written > 0 else "wb")
+    # Drop anything written after the last saved state
+    out.truncate(written)
+    out.seek(written)
+    if written == 0 and fmt == "csv":
+        header = [{"value": field} for field in fields]
+        written += out.write(format_export_row(fmt, fields, header).encode("utf-8"))
+    start = time.monotonic()
+    start_rows, start_written = rows, written
+    next_offset = offset
+    pending = {}
+    finished = False
+    try:
+        while not finished:
+            if stop is not None and stop.is_set():
+                break
+            # Back-pressure: never have more than workers pages in flight
+            while next_offset < offset + workers*limit:
+                pending[next_offset] = scheduler.submit(endpoint, PRIORITY_BULK, fetch_export_page, endpoint,
+                                                        mode, limit, next_offset, keyword, uri, dbpedia, timeout)
+                next_offset += limit
+            page = pending.pop(offset).result()
+            chunk = "".join(format_export_row(fmt, fields, row) for row in page)
+            written += out.write(chunk.encode("utf-8"))
+            out.flush()
+            rows += len(page)
+            offset += limit
+            finished = len(page) < limit
+            with open(state_path, "w") as f:
+                json.dump({"params": params, "offset": offset, "rows": rows, "bytes": written}, f)
+            if progress is not None:
+                elapsed = max(time.monotonic() - start, 1e-6)
+                progress(rows, written, (rows - start_rows)/elapsed, (written - start_written)/elapsed)
+    finally:
+        for f in pending.values():
+            f.cancel()
+        out.close()
+    if finished:
+        os.remove(state_path)
+    return (rows, written)
+
+def data_size(data):
+    """
+    Returns rough size of data in memory in bytes
+    """
+    if isinstance(data, (list, tuple)):
+        return sys.getsizeof(data) + sum(data_size(x) for x in data)
+    if isinstance(data, dict):
+        return sys.getsizeof(data) + sum(data_size(k) + data_size(v) for k, v in data.items())
+    return sys.getsizeof(data)
+
+class ViewHistory:
+    """
+    Back and forward history of displayed views
+    Every entry keeps data fetched for it, so going back does not query the endpoint again.
+    Data are kept under a memory budget, least recently shown ones are dropped first.
+    """
+
+    def __init__(self, budget=32*1024*1024, max_entries=200):
+        """
+        Constructor
+        :param budget Maximum size of kept data in bytes
+        :param max_entries Maximum amount of entries in history
+        """
+        self.budget = budget
+        self.max_entries = max_entries
+        self.entries = []
+        self.index = -1
+        self.cached = OrderedDict()
+        self.size = 0
+
+    def push(self, entry):
+        """
+        Adds entry after the current one, dropping all forward entries
+        """
+        for e in self.entries[self.index+1:]:
+            self.drop(e)
+        self.entries = self.entries[:self.index+1]
+        self.entries.append(entry)
+        if len(self.entries) > self.max_entries:
+            self.drop(self.entries.pop(0))
+        self.index = len(self.entries) - 1
+        self.touch(entry)
+
+    def can_go_back(self):
+        """
+        Returns True if there is an entry before the current one
+        """
+        return self.index > 0
+
+    def can_go_forward(self):
+        """
+        Returns True if there is an entry after the current one
+        """
+        return self.index < len(self.entries) - 1
+
+    def peek(self, step):
+        """
+        Returns entry step entries from the current one or None
+        """
+        index = self.index + step
+        if index < 0 or index >= len(self.entries):
+            return None
+        return self.entries[index]
+
+    def move(self, step):
+        """
+        Moves step entries from the current one and returns the entry
+        """
+        self.index += step
+        return self.entries[self.index]
+
+    def store(self, entry, data):
+        """
+        Stores fetched data of an entry
+        """
+        self.drop(entry)
+        entry["data"] = data
+        entry["size"] = data_size(data)
+        self.touch(entry)
+
+    def touch(self, entry):
+        """
+        Marks entry's data as recently used and evicts data over the budget
+        """
+        if entry["data"] is None:
+            return
+        if id(entry) not in self.cached:
+            self.cached[id(entry)] = entry
+            self.size += entry["size"]
+        self.cached.move_to_end(id(entry))
+        while self.size > self.budget and len(self.cached) > 1:
+            self.drop(next(iter(self.cached.values())))
+
+    def drop(self, entry):
+        """
+        Drops data of an entry
+        """
+        if self.cached.pop(id(entry), None) is not None:
+            self.size -= entry["size"]
+        entry["data"] = None
+
+# Amount of uris resolved by one query
+LABEL_BATCH_SIZE = 50
+# Seconds for which uris without a label are not queried again on the same endpoint
+LABEL_MISS_TTL = 600
+# Characters which cannot be in an iri written into a query
+INVALID_IRI_RE = re.compile(r"[<>\"{}|^`\\\s]")
+
+class LabelResolver:
+    """
+    Resolves display names of uris in batches and caches them
+    Labels are shared by all views and endpoints. Uris without any label
+    are shown in their format_uri form and are remembered only for the endpoint
+    which did not have the label, for LABEL_MISS_TTL seconds.
+    """
+
+    def __init__(self, lang="en", max_entries=100000):
+        """
+        Constructor
+        :param lang Preferred language of labels
+        :param max_entries Maximum amount of cached labels
+        """
+        self.lang = lang
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.labels = OrderedDict()
+        self.missing = OrderedDict()
+        self.pending = set()
+
+    def display_name(self, uri):
+        """
+        Returns label of uri if it is known, otherwise its formatted form
+        """
+        with self.lock:
+            if uri in self.labels:
+                self.labels.move_to_end(uri)
+                return self.labels[uri]
+        return self.fallback(uri)
+
+    def fallback(self, uri):
+        """
+        Returns name of uri without a label
+        """
+        try:
+            return format_uri(uri) or uri
+        except ValueError:
+            return uri
+
+    def resolve(self, endpoint, uris, callback=None):
+        """
+        Queues resolution of uris without known labels as prefetch requests
+        :param callback Function called from a worker thread after each resolved batch
+        """
+        now = time.monotonic()
+        with self.lock:
+            todo = [x for x in dict.fromkeys(uris)
+                    if x not in self.labels and (endpoint, x) not in self.pending
+                    and self.missing.get((endpoint, x), 0) < now and not INVALID_IRI_RE.search(x)]
+            self.pending.update((endpoint, x) for x in todo)
+        for i in range(0, len(todo), LABEL_BATCH_SIZE):
+            batch = todo[i:i+LABEL_BATCH_SIZE]
+            future = scheduler.submit(endpoint, PRIORITY_PREFETCH, self.fetch, endpoint, batch)
+            future.add_done_callback(lambda f, batch=batch: self.resolved(f, endpoint, batch, callback))
+
+    def fetch(self, endpoint, batch):
+        """
+        Queries labels of one batch, this is run by the scheduler
+        """
+        return get_labels(SPARQLWrapper(endpoint), batch, self.lang)
+
+    def resolved(self, future, endpoint, batch, callback):
+        """
+        Stores labels of a finished batch
+        Cancelled or failed batches are not cached, so they are resolved next time.
+        """
+        with self.lock:
+            self.pending.difference_update((endpoint, x) for x in batch)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            print("Could not resolve labels from ", endpoint, ": ", future.exception(), file=sys.stderr)
+            return
+        found = future.result()
+        expires = time.monotonic() + LABEL_MISS_TTL
+        with self.lock:
+            for uri in batch:
+                if found.get(uri):
+                    self.labels[uri] = found[uri]
+                    self.labels.move_to_end(uri)
+                else:
+                    self.missing[(endpoint, uri)] = expires
+                    self.missing.move_to_end((endpoint, uri))
+            while len(self.labels) > self.max_entries:
+                self.labels.popitem(last=False)
+            while len(self.missing) > self.max_entries:
+                self.missing.popitem(last=False)
+        if callback is not None:
+            callback()
+
+label_resolver = LabelResolver()
 
 class ResultLabel(QLabel):
     """
@@ -194,6 +994,8 @@ class MainWindow(QMainWindow):
     Main application window
     """
 
+    labels_resolved = QtCore.pyqtSignal()
+
     def __init__(self, width=1024, height=600):
         super(MainWindow, self).__init__()
         self.setWindowTitle("Sparql Search")
@@ -219,6 +1021,10 @@ class MainWindow(QMainWindow):
         self.mb_endpoint = self.menu_bar.addAction(self.button_endpoint)
         self.button_endpoint.triggered.connect(self.show_endpoint)
 
+        self.button_export = QAction("Export")
+        self.mb_export = self.menu_bar.addAction(self.button_export)
+        self.button_export.triggered.connect(self.show_export)
+
         self.button_about = QAction("About")
         self.mb_about = self.menu_bar.addAction(self.button_about)
         self.button_about.triggered.connect(self.show_about)
@@ -240,6 +1046,19 @@ class MainWindow(QMainWindow):
         self.in_db.currentIndexChanged.connect(self.in_db_changed)
         self.top_layout.addWidget(self.in_db)
 
+        # history buttons
+        self.back_button = QPushButton("")
+        self.back_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.SP_ArrowBack))
+        self.back_button.pressed.connect(self.back_pressed)
+        self.back_button.setEnabled(False)
+        self.top_layout.addWidget(self.back_button)
+
+        self.forward_button = QPushButton("")
+        self.forward_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.SP_ArrowForward))
+        self.forward_button.pressed.connect(self.forward_pressed)
+        self.forward_button.setEnabled(False)
+        self.top_layout.addWidget(self.forward_button)
+
         # home button
         self.home_button = QPushButton("")
         self.home_button.setIcon(self.style().standardIcon(QtWidgets.QStyle.SP_DirHomeIcon))
@@ -283,7 +1102,12 @@ class MainWindow(QMainWindow):
         self.page_layout.addWidget(self.right_button)
 
         self.db_searched = True
+        self.info_uri = None
         self.timeout = 10000
+        self.history = ViewHistory()
+        self.triplets_label = None
+        self.triplets = []
+        self.labels_resolved.connect(self.update_labels)
 
         # Add layout
         self._layout.addLayout(self.top_layout)
@@ -300,9 +1124,15 @@ class MainWindow(QMainWindow):
         self.about_window = AboutWindow(self)
         self.preferences_window = Preferences(self)
         self.add_endpoint_window = AddCustomEndpoint(self)
+        self.export_window = ExportWindow(self)
 
         self.in_db_changed(self.in_db.currentIndex())
 
+        # Request queue status
+        self.queue_timer = QtCore.QTimer(self)
+        self.queue_timer.timeout.connect(self.update_queue_status)
+        self.queue_timer.start(1000)
+
         self.update()
 
     def initUI(self):
@@ -316,6 +1146,29 @@ class MainWindow(QMainWindow):
         self.offset = 0
         self.show()
 
+    def query(self, func, *args, sparql=None):
+        """
+        Runs query function on current endpoint as an interactive request
+        Queued prefetching for the endpoint is cancelled, since user moved on.
+        :param sparql Endpoint to be used instead of the current one
+        """
+        if sparql is None:
+            sparql = self.sparql
+        scheduler.cancel_queued(PRIORITY_PREFETCH, sparql.endpoint)
+        return scheduler.submit(sparql.endpoint, PRIORITY_INTERACTIVE, func, sparql, *args).result()
+
+    def update_queue_status(self):
+        """
+        Shows amount of queued background requests in status bar
+        """
+        stats = scheduler.get_stats()
+        waiting = [name for name in PRIORITY_NAMES if stats[name]["queued"] > 0]
+        if len(waiting) == 0:
+            self.statusBar().clearMessage()
+            return
+        self.statusBar().showMessage(", ".join("{} queued {} (avg wait {:.1f} s)".format(
+            name, stats[name]["queued"], stats[name]["avg_wait"]) for name in waiting))
+
     def show_preferences(self):
         """
         Shows preferences settings
@@ -328,6 +1181,12 @@ class MainWindow(QMainWindow):
         """
         self.add_endpoint_window.show()
 
+    def show_export(self):
+        """
+        Shows export window
+        """
+        self.export_window.show()
+
     def show_about(self):
         """
         Shows about info
@@ -353,29 +1212,71 @@ class MainWindow(QMainWindow):
         """
         Event handler for left button
         """
-        if self.offset > self.limit:
-            self.offset -= self.limit
-        else:
-            self.offset = 0
-            self.left_button.setEnabled(False)
-        self.right_button.show()
+        if self.info_uri is not None or self.is_next_page(self.history.peek(-1), -1):
+            self.back_pressed()
+            return
+        self.offset = max(self.offset - self.limit, 0)
         if self.db_searched:
             self.search_db()
         else:
             self.search()
-        self.page_number.setText("page "+str(self.offset//self.limit+1))
 
     def right_button_pressed(self):
         """
         Event handler for right button
         """
+        if self.is_next_page(self.history.peek(1), 1):
+            self.forward_pressed()
+            return
         self.offset += self.limit
-        self.left_button.setEnabled(True)
         if self.db_searched:
             self.search_db()
         else:
             self.search()
-        self.page_number.setText("page "+str(self.offset//self.limit+1))
+
+    def is_next_page(self, entry, step):
+        """
+        Checks if history entry is page step pages away from the current one
+        """
+        current = self.history.peek(0)
+        if entry is None or current is None:
+            return False
+        return (entry["view"] == current["view"] and entry["sparql"] is current["sparql"]
+                and entry["keyword"] == current["keyword"] and entry["limit"] == current["limit"]
+                and entry["offset"] == current["offset"] + step*current["limit"])
+
+    def back_pressed(self):
+        """
+        Event handler for back button
+        """
+        if self.history.can_go_back():
+            self.go_to(-1)
+
+    def forward_pressed(self):
+        """
+        Event handler for forward button
+        """
+        if self.history.can_go_forward():
+            self.go_to(1)
+
+    def go_to(self, step):
+        """
+        Moves step entries in history and displays the entry
+        Data dropped from history because of its memory budget are fetched again
+        first, so nothing changes when that fails.
+        """
+        entry = self.history.peek(step)
+        if entry["data"] is None:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                self.history.store(entry, self.fetch_view(entry))
+            except Exception as e:
+                print("Could not load view: ", e, file=sys.stderr)
+                return
+            finally:
+                QApplication.restoreOverrideCursor()
+        self.history.move(step)
+        self.show_view(entry)
 
     def clear_results(self):
         """
@@ -384,9 +1285,12 @@ class MainWindow(QMainWindow):
         for r in self.results:
             self._layout.removeWidget(r)
             r.setParent(None)
+        self.triplets_label = None
         self._layout = QVBoxLayout()
         self.top_layout = QHBoxLayout()
         self.top_layout.addWidget(self.in_db)
+        self.top_layout.addWidget(self.back_button)
+        self.top_layout.addWidget(self.forward_button)
         self.top_layout.addWidget(self.home_button)
         self.top_layout.addWidget(self.search_box)
         self.top_layout.addWidget(self.search_button)
@@ -422,15 +1326,90 @@ class MainWindow(QMainWindow):
         self.db_searched = True
         self.search_db()
 
+    def new_view(self, view, uri=None):
+        """
+        Creates history entry for a view of current endpoint
+        """
+        return {"view": view, "db": self.in_db.currentIndex(), "sparql": self.sparql,
+                "offset": self.offset, "limit": self.limit, "keyword": self.search_box.text(),
+                "uri": uri, "data": None}
+
+    def open_view(self, entry):
+        """
+        Fetches data of a new view, adds it to history and displays it
+        """
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            self.history.store(entry, self.fetch_view(entry))
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.history.push(entry)
+        self.show_view(entry)
+
+    def fetch_view(self, entry):
+        """
+        Queries data displayed in a view on the view's endpoint
+        """
+        sparql = entry["sparql"]
+        if entry["view"] == "all":
+            return self.query(get_db_all, entry["limit"], entry["offset"], sparql=sparql)
+        elif entry["view"] == "search":
+            if entry["db"] == 0:
+                # DBPedia
+                results = self.query(search_dbpedia, entry["keyword"], entry["limit"], entry["offset"],
+                                     self.timeout, sparql=sparql)
+            else:
+                results = self.query(search_general_db, entry["keyword"], entry["limit"], entry["offset"],
+                                     self.timeout, sparql=sparql)
+            return [self.query(get_dbpedia_info, result["c1"]["value"], sparql=sparql) for result in results]
+        else:
+            return (self.query(get_dbpedia_info, entry["uri"], sparql=sparql),
+                    self.query(get_all_triplets, entry["uri"], 20, sparql=sparql))
+
+    def show_view(self, entry):
+        """
+        Restores state of a view from history and displays it
+        """
+        if self.in_db.currentIndex() != entry["db"]:
+            self.in_db.blockSignals(True)
+            self.in_db.setCurrentIndex(entry["db"])
+            self.in_db.blockSignals(False)
+        self.sparql = entry["sparql"]
+        self.search_box.setText(entry["keyword"])
+        self.offset = entry["offset"]
+        self.db_searched = entry["view"] == "all"
+        self.info_uri = entry["uri"]
+        self.history.touch(entry)
+        self.clear_results()
+        if entry["view"] == "info":
+            self.right_button.hide()
+            self.page_number.setText("")
+            self.left_button.setEnabled(self.history.can_go_back())
+            self.show_info(entry["data"])
+        else:
+            self.right_button.show()
+            self.page_number.setText("page "+str(entry["offset"]//entry["limit"]+1))
+            self.left_button.setEnabled(entry["offset"] > 0)
+            self.right_button.setEnabled(len(entry["data"]) == entry["limit"])
+            if entry["view"] == "all":
+                self.show_db_all(entry["data"])
+            else:
+                self.show_search(entry["data"])
+        self.back_button.setEnabled(self.history.can_go_back())
+        self.forward_button.setEnabled(self.history.can_go_forward())
+        self.update()
+
     def search_db(self):
         """
         Searches top db
         """
         print("Searching top DB at ", self.offset)
-        self.right_button.show()
-        self.clear_results()
-        self.page_number.setText("page "+str(self.offset//self.limit+1))
-        results = get_db_all(self.sparql, self.limit, self.offset)
+        self.open_view(self.new_view("all"))
+
+    def show_db_all(self, results):
+        """
+        Displays top level data of db
+        """
         for result in results:
             d = ResultLabel(result[1], result[0], self)
             d.setWordWrap(True)
@@ -447,33 +1426,19 @@ class MainWindow(QMainWindow):
                         "}")
             self.results.append(d)
             self._layout.addWidget(d)
-        if len(results) == self.limit:
-            self.right_button.setEnabled(True)
-        else:
-            self.right_button.setEnabled(False)
-        self.update()
 
     def search(self):
         """
         Searches db based on keyword
         """
-        keyword = self.search_box.text()
-        db = self.in_db.currentIndex()
-        print("Searching ", keyword, " in db ", db, " at ", self.offset)
-        self.right_button.show()
-        if self.offset == 0:
-            self.left_button.setEnabled(False)
-        self.page_number.setText("page "+str(self.offset//self.limit+1))
-        self.clear_results()
-        self.results = []
-        QApplication.setOverrideCursor(Qt.WaitCursor)
-        if db == 0:
-            # DBPedia
-            results = search_dbpedia(self.sparql, keyword, self.limit, self.offset, self.timeout)
-        else:
-            results = search_general_db(self.sparql, keyword, self.limit, self.offset, self.timeout)
-        for result in results:
-            data = get_dbpedia_info(self.sparql, result["c1"]["value"])
+        print("Searching ", self.search_box.text(), " in db ", self.in_db.currentIndex(), " at ", self.offset)
+        self.open_view(self.new_view("search"))
+
+    def show_search(self, results):
+        """
+        Displays results of keyword search
+        """
+        for data in results:
             header = data[1]
             body = data[2]
             wiki = "" if len(data[3]) == 0 else "  <small><a href="+data[3]+">wiki</a></small>"
@@ -494,12 +1459,6 @@ class MainWindow(QMainWindow):
                         "}")
             self.results.append(d)
             self._layout.addWidget(d)
-        if len(results) == self.limit:
-            self.right_button.setEnabled(True)
-        else:
-            self.right_button.setEnabled(False)
-        self.update()
-        QApplication.restoreOverrideCursor()
 
     def search_as_keyword(self):
         """
@@ -514,14 +1473,13 @@ class MainWindow(QMainWindow):
         Displays more info about a uri
         """
         print("More info ", uri)
-        self.right_button.hide()
-        self.page_number.setText("")
-        self.left_button.setEnabled(True)
-        # Increase offset so left works correctly
-        self.offset += self.limit
-        self.clear_results()
-        QApplication.setOverrideCursor(Qt.WaitCursor)
-        data = get_dbpedia_info(self.sparql, uri)
+        self.open_view(self.new_view("info", uri))
+
+    def show_info(self, view_data):
+        """
+        Displays information and triplets of a uri
+        """
+        data, results = view_data
         search_button = QPushButton("Search as keyword")
         self.keyword = data[1]
         search_button.pressed.connect(self.search_as_keyword)
@@ -554,22 +1512,10 @@ class MainWindow(QMainWindow):
         bodylabel.adjustSize()
         self.results.append(bodylabel)
         self._layout.addWidget(bodylabel)
-        results = get_all_triplets(self.sparql, uri, 20)
-        text = ""
-        for _, p, o in results:
-            if p[:4] == "http":
-                p_form = "<a href="+p+">"+p+"</a>"
-            else:
-                p_form = p
-            if o[:4] == "http":
-                o_form = "<a href="+o+">"+o+"</a>"
-            else:
-                o_form = o
-            text += "<i>in predicate</i> "+p_form+" <i>with</i> "+ o_form + "<br>"
         d = QLabel()
         d.setWordWrap(True)
         d.setTextFormat(Qt.RichText)
-        d.setText("<html>"+text+"</html>")
+        d.setText(self.triplets_text(results))
         d.setOpenExternalLinks(True)
         d.adjustSize()
         d.setStyleSheet(
@@ -580,8 +1526,35 @@ class MainWindow(QMainWindow):
                     "}")
         self.results.append(d)
         self._layout.addWidget(d)
-        self.update()
-        QApplication.restoreOverrideCursor()
+        self.triplets_label = d
+        self.triplets = results
+        # Labels of iris are filled in once they are resolved
+        iris = [x for _, p, o in results for x in (p, o) if x[:4] == "http"]
+        label_resolver.resolve(self.sparql.endpoint, iris, self.labels_resolved.emit)
+
+    def triplets_text(self, results):
+        """
+        Creates html text of triplets with iris shown by their labels
+        """
+        text = ""
+        for _, p, o in results:
+            if p[:4] == "http":
+                p_form = "<a href="+p+">"+html.escape(label_resolver.display_name(p))+"</a>"
+            else:
+                p_form = p
+            if o[:4] == "http":
+                o_form = "<a href="+o+">"+html.escape(label_resolver.display_name(o))+"</a>"
+            else:
+                o_form = o
+            text += "<i>in predicate</i> "+p_form+" <i>with</i> "+ o_form + "<br>"
+        return "<html>"+text+"</html>"
+
+    def update_labels(self):
+        """
+        Event handler for when labels of iris are resolved
+        """
+        if self.triplets_label is not None:
+            self.triplets_label.setText(self.triplets_text(self.triplets))
 
     def in_db_changed(self, v):
         """
@@ -665,6 +1638,145 @@ class AddCustomEndpoint(QMainWindow):
         self.hide()
 
 
+class ExportWindow(QMainWindow):
+    """
+    Window for exporting all results of current view into a file
+    """
+
+    progress_changed = QtCore.pyqtSignal(str)
+    export_finished = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None):
+        """
+        Constructor
+        :param parent Window that should be this window's parent
+        """
+        super(ExportWindow, self).__init__(parent)
+        self.parent = parent
+        self.stop_event = None
+        self.setWindowTitle("Export")
+        self.setWindowFlags(self.windowFlags() & ~QtCore.Qt.WindowMaximizeButtonHint)
+        self.setWindowFlags(self.windowFlags() & ~QtCore.Qt.WindowMinimizeButtonHint)
+
+        # Input form
+        self.form_layout = QFormLayout()
+
+        # Output file
+        self.path_input = QLineEdit()
+        self.browse_button = QPushButton("Browse")
+        self.browse_button.pressed.connect(self.browse)
+        path_layout = QHBoxLayout()
+        path_layout.addWidget(self.path_input)
+        path_layout.addWidget(self.browse_button)
+        self.form_layout.addRow("Output file", path_layout)
+
+        # Format
+        self.format_input = QComboBox()
+        self.format_input.addItem("JSON Lines", "jsonl")
+        self.format_input.addItem("CSV", "csv")
+        self.format_input.addItem("N-Triples", "nt")
+        self.form_layout.addRow("Format", self.format_input)
+
+        # Concurrency
+        self.workers_input = QLineEdit()
+        self.workers_input.setValidator(QIntValidator(1, 32))
+        self.workers_input.setText("4")
+        self.form_layout.addRow("Maximum concurrent requests", self.workers_input)
+
+        self.resume_input = QCheckBox("Resume interrupted export")
+        self.form_layout.addRow(self.resume_input)
+
+        self.status = QLabel("")
+        self.form_layout.addRow(self.status)
+        self.progress_changed.connect(self.status.setText)
+        self.export_finished.connect(self.finished_export)
+
+        # Start and stop
+        self.export_button = QPushButton("Export", self)
+        self.export_button.pressed.connect(self.start_export)
+        self.stop_button = QPushButton("Stop", self)
+        self.stop_button.pressed.connect(self.stop_export)
+        self.stop_button.setEnabled(False)
+        self.form_layout.addRow(self.export_button, self.stop_button)
+
+        # Layout and move
+        wid = QtWidgets.QWidget(self)
+        self.setCentralWidget(wid)
+        wid.setLayout(self.form_layout)
+        self.move(parent.x() + parent.width()//2 - self.width(), parent.y())
+        self.update()
+        self.hide()
+
+    def browse(self):
+        """
+        Opens dialog for selecting output file
+        """
+        path, _ = QFileDialog.getSaveFileName(self, "Export to")
+        if path:
+            self.path_input.setText(path)
+
+    def start_export(self):
+        """
+        Starts export of results shown in main window in the background
+        """
+        path = self.path_input.text()
+        if len(path) == 0:
+            return
+        try:
+            workers = int(self.workers_input.text())
+        except Exception:
+            workers = 4
+        # Export what is on the screen, not what was typed into the search box since
+        entry = self.parent.history.peek(0)
+        if entry is None:
+            return
+        mode = {"info": "triplets"}.get(entry["view"], entry["view"])
+        self.stop_event = threading.Event()
+        self.export_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        thread = threading.Thread(target=self.run_export, daemon=True,
+                                  args=(entry["sparql"].endpoint, path, self.format_input.currentData(),
+                                        mode, entry["keyword"], entry["uri"], entry["db"] == 0, workers,
+                                        self.resume_input.isChecked(), self.parent.timeout))
+        thread.start()
+
+    def run_export(self, endpoint, path, fmt, mode, keyword, uri, dbpedia, workers, resume, timeout):
+        """
+        Runs export, this is called from a background thread
+        """
+        def progress(rows, written, rows_s, bytes_s):
+            self.progress_changed.emit("{} rows, {} kB ({:.1f} rows/s, {:.1f} kB/s)".format(
+                rows, written//1024, rows_s, bytes_s/1024))
+        try:
+            rows, written = export_results(endpoint, path, fmt, mode, keyword, uri, dbpedia, workers=workers,
+                                           resume=resume, timeout=timeout, progress=progress,
+                                           stop=self.stop_event)
+            if self.stop_event.is_set():
+                self.progress_changed.emit("Stopped after {} rows".format(rows))
+            else:
+                self.progress_changed.emit("Exported {} rows ({} kB)".format(rows, written//1024))
+        except ValueError as e:
+            self.progress_changed.emit(str(e))
+        except Exception as e:
+            print("Export failed: ", e, file=sys.stderr)
+            self.progress_changed.emit("Export failed, it can be resumed")
+        self.export_finished.emit()
+
+    def finished_export(self):
+        """
+        Event handler for when export ends
+        """
+        self.export_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+
+    def stop_export(self):
+        """
+        Stops running export
+        """
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+
 class Preferences(QMainWindow):
     """
     Window containing search parameters
@@ -777,7 +1889,46 @@ class AboutWindow(QMainWindow):
         self.hide()
 
 
+def main_export(args):
+    """
+    Runs export from command line without the GUI
+    """
+    def progress(rows, written, rows_s, bytes_s):
+        print("\r{} rows, {} kB ({:.1f} rows/s, {:.1f} kB/s)".format(
+            rows, written//1024, rows_s, bytes_s/1024), end="", file=sys.stderr)
+    try:
+        rows, written = export_results(args.endpoint, args.export, args.format, args.mode, args.keyword,
+                                       args.uri, args.dbpedia, args.page_size, args.workers, args.resume, args.timeout,
+                                       progress)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print("\nExported {} rows ({} bytes)".format(rows, written), file=sys.stderr)
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Interactive application for searching through SPARQL databases.")
+    parser.add_argument("--export", metavar="FILE", help="export all results into FILE without starting the GUI")
+    parser.add_argument("--endpoint", default="http://dbpedia.org/sparql", help="endpoint to export from")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl", help="export format")
+    parser.add_argument("--mode", choices=EXPORT_MODES, default="all",
+                        help="export top level data, keyword search or triplets of an uri")
+    parser.add_argument("--keyword", help="keyword for search mode")
+    parser.add_argument("--uri", help="uri for triplets mode")
+    parser.add_argument("--dbpedia", action="store_true",
+                        help="use DBPedia full text search in search mode, as the GUI does for DBPedia")
+    parser.add_argument("--page-size", type=int, default=100, help="rows fetched in one request")
+    parser.add_argument("--workers", type=int, default=4, help="maximum of concurrent requests")
+    parser.add_argument("--timeout", type=int, default=10000, help="search timeout [ms]")
+    parser.add_argument("--resume", action="store_true", help="resume interrupted export")
+    # Other arguments are left for Qt, but mistyped options of this program are errors
+    args, qt_args = parser.parse_known_args()
+    unknown = [x for x in qt_args if x.startswith("--")]
+    if len(unknown) > 0:
+        parser.error("unrecognized arguments: "+" ".join(unknown))
+    if args.export is not None:
+        main_export(args)
+        sys.exit(0)
+    app = QApplication(sys.argv[:1] + qt_args)
     win = MainWindow()
     sys.exit(app.exec_())
@@ -0,0 +1,127 @@
+"""
+Tests of the caching proxy against a stand-in upstream endpoint
+"""
+
+import json
+import time
+import socket
+import asyncio
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import sparql_proxy
+
+
+class StandInEndpoint(BaseHTTPRequestHandler):
+    """
+    Upstream answering every query slowly with the request it got
+    """
+
+    requests = 0
+
+    def do_GET(self):
+        StandInEndpoint.requests += 1
+        time.sleep(0.3)
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        StandInEndpoint.requests += 1
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"path": self.path, "body": data.decode("utf-8")}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSPARQLProxy(unittest.TestCase):
+
+    def setUp(self):
+        StandInEndpoint.requests = 0
+        self.upstream_server = ThreadingHTTPServer(("127.0.0.1", 0), StandInEndpoint)
+        threading.Thread(target=self.upstream_server.serve_forever, daemon=True).start()
+        self.upstream = "http://127.0.0.1:{}/sparql".format(self.upstream_server.server_port)
+        self.proxy = sparql_proxy.SPARQLProxy(self.upstream)
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.proxy.handle, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.upstream_server.shutdown()
+        self.upstream_server.server_close()
+
+    def get(self, path, data=None, content_type=None):
+        request = urllib.request.Request("http://127.0.0.1:{}{}".format(self.port, path), data=data)
+        if content_type is not None:
+            request.add_header("Content-Type", content_type)
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+    def test_coalesced_and_cached(self):
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(self.get, ["/?query=SELECT+1&format=json"]*5))
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(StandInEndpoint.requests, 1)
+        # Same query with parameters in different order is served from cache
+        self.assertEqual(self.get("/?format=json&query=SELECT+1"), results[0])
+        self.assertEqual(StandInEndpoint.requests, 1)
+        stats = json.loads(self.get("/stats"))
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["coalesced"], 4)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["upstreams"][self.upstream]["requests"], 1)
+
+    def test_upstream_in_path(self):
+        self.assertIn(b"/sparql?query=X", self.get("/"+self.upstream+"?query=X"))
+        self.assertEqual(StandInEndpoint.requests, 1)
+
+    def test_not_allowed_upstream(self):
+        with self.assertRaises(urllib.error.HTTPError) as e:
+            self.get("/http://127.0.0.1:1/sparql?query=X")
+        self.assertEqual(e.exception.code, 403)
+        self.assertEqual(StandInEndpoint.requests, 0)
+
+    def test_body_too_large(self):
+        # Only headers are sent, so the status cannot be lost to a reset connection
+        with socket.create_connection(("127.0.0.1", self.port)) as client:
+            client.sendall("POST / HTTP/1.1\r\nHost: localhost\r\nContent-Length: {}\r\n\r\n".format(
+                sparql_proxy.MAX_BODY_SIZE+1).encode("latin-1"))
+            status = client.makefile("rb").readline().split()
+        self.assertEqual(status[1], b"413")
+        self.assertEqual(StandInEndpoint.requests, 0)
+
+    def test_updates_not_cached(self):
+        query = "/?query=SELECT+1"
+        self.get(query)
+        update = b"INSERT DATA { <urn:a> <urn:b> <urn:c> }"
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda _: self.get("/", update, "application/sparql-update"), range(2)))
+        self.assertEqual(json.loads(results[0])["body"], update.decode("utf-8"))
+        self.get("/", b"update=DELETE+DATA+%7B%7D", "application/x-www-form-urlencoded")
+        self.assertEqual(StandInEndpoint.requests, 4)
+        # Updates drop cached queries of the upstream
+        self.get(query)
+        self.assertEqual(StandInEndpoint.requests, 5)
+        stats = json.loads(self.get("/stats"))
+        self.assertEqual(stats["updates"], 3)
+        self.assertEqual(stats["coalesced"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,333 @@
+"""
+Tests of query, export and history logic of Sparql Search, which does not need the GUI
+"""
+
+import os
+import gzip
+import zlib
+import time
+import tempfile
+import threading
+import unittest
+import urllib.error
+from unittest import mock
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from SPARQLWrapper import SPARQLWrapper
+
+import sparql_search
+
+
+class BrokenGzipEndpoint(BaseHTTPRequestHandler):
+    """
+    Endpoint answering every query with a truncated gzip body
+    """
+
+    def do_GET(self):
+        body = gzip.compress(b"?s\n<urn:a>\n")[:-8]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/tab-separated-values")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestResultFormats(unittest.TestCase):
+
+    def test_tsv_terms(self):
+        self.assertEqual(sparql_search.parse_tsv_term("<http://a/b>"), {"type": "uri", "value": "http://a/b"})
+        self.assertEqual(sparql_search.parse_tsv_term("_:b0"), {"type": "bnode", "value": "b0"})
+        self.assertEqual(sparql_search.parse_tsv_term('"Praha"@cs'),
+                         {"type": "literal", "value": "Praha", "xml:lang": "cs"})
+        self.assertEqual(sparql_search.parse_tsv_term('"5"^^<http://www.w3.org/2001/XMLSchema#int>'),
+                         {"type": "literal", "value": "5", "datatype": "http://www.w3.org/2001/XMLSchema#int"})
+        self.assertEqual(sparql_search.parse_tsv_term("1.5")["datatype"], "http://www.w3.org/2001/XMLSchema#decimal")
+        self.assertEqual(sparql_search.parse_tsv_term("true")["datatype"], "http://www.w3.org/2001/XMLSchema#boolean")
+
+    def test_tsv_escapes(self):
+        self.assertEqual(sparql_search.parse_tsv_term(r'"a\tb\nc\"d\\e"')["value"], 'a\tb\nc"d\\e')
+        self.assertEqual(sparql_search.parse_tsv_term(r'"é\U0001F600"')["value"], "é\U0001F600")
+
+    def test_tsv_results(self):
+        bindings = sparql_search.parse_tsv_results('?s\t?o\n<urn:a>\t"x"\r\n<urn:b>\t\n')
+        self.assertEqual(bindings, [{"s": {"type": "uri", "value": "urn:a"}, "o": {"type": "literal", "value": "x"}},
+                                    {"s": {"type": "uri", "value": "urn:b"}}])
+        self.assertEqual(sparql_search.parse_tsv_results("?s\n"), [])
+
+    def test_tsv_row_without_bound_variables(self):
+        self.assertEqual(sparql_search.parse_tsv_results("?s\n<urn:a>\n\n<urn:b>\n"),
+                         [{"s": {"type": "uri", "value": "urn:a"}}, {}, {"s": {"type": "uri", "value": "urn:b"}}])
+
+    def test_tsv_not_results(self):
+        with self.assertRaises(sparql_search.ResultFormatError):
+            sparql_search.parse_tsv_results("<html>\n")
+
+    def test_csv_results(self):
+        bindings = sparql_search.parse_csv_results('s,name\r\nhttp://a/b,"x, ""y"""\r\nurn:c,\r\n')
+        self.assertEqual(bindings, [
+            {"s": {"type": "uri", "value": "http://a/b"}, "name": {"type": "literal", "value": 'x, "y"'}},
+            {"s": {"type": "uri", "value": "urn:c"}, "name": {"type": "literal", "value": ""}}])
+        with self.assertRaises(sparql_search.ResultFormatError):
+            sparql_search.parse_csv_results("<html>\n")
+
+    def test_deflate(self):
+        compress = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw = compress.compress(b"data") + compress.flush()
+        self.assertEqual(sparql_search.decompress(raw, "deflate"), b"data")
+        self.assertEqual(sparql_search.decompress(zlib.compress(b"data"), "deflate"), b"data")
+        self.assertEqual(sparql_search.decompress(b"data", ""), b"data")
+
+    def test_broken_compression_is_not_format_error(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), BrokenGzipEndpoint)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            sparql = SPARQLWrapper("http://127.0.0.1:{}/sparql".format(server.server_port))
+            sparql.setQuery("SELECT ?s WHERE { ?s ?p ?o }")
+            with self.assertRaises(urllib.error.URLError):
+                sparql_search.fetch_select(sparql, "tsv")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestFormatNegotiator(unittest.TestCase):
+
+    def test_samples_every_format(self):
+        negotiator = sparql_search.FormatNegotiator()
+        for fmt in ("json", "tsv", "csv"):
+            for _ in range(sparql_search.NEGOTIATION_SAMPLES):
+                self.assertEqual(negotiator.choose("e", "shape"), fmt)
+                negotiator.record("e", "shape", fmt, 10, 1000, 0.1, 0.01)
+        # Queries returning no rows do not count
+        negotiator.record("e", "other", "json", 0, 100, 0.1, 0.01)
+        self.assertEqual(negotiator.choose("e", "other"), "json")
+
+    def test_cheapest_per_shape(self):
+        negotiator = sparql_search.FormatNegotiator()
+        for _ in range(sparql_search.NEGOTIATION_SAMPLES):
+            negotiator.record("e", "small", "json", 10, 100, 0.1, 0.001)
+            negotiator.record("e", "small", "tsv", 10, 100, 0.1, 0.01)
+            negotiator.record("e", "small", "csv", 10, 100, 0.1, 0.01)
+            negotiator.record("e", "large", "json", 10, 5000, 0.1, 0.05)
+            negotiator.record("e", "large", "tsv", 10, 1000, 0.1, 0.01)
+            negotiator.record("e", "large", "csv", 10, 800, 0.1, 0.01)
+        self.assertEqual(negotiator.choose("e", "small"), "json")
+        self.assertEqual(negotiator.choose("e", "large"), "csv")
+        # CSV loses term types
+        self.assertEqual(negotiator.choose("e", "large", typed=True), "tsv")
+
+    def test_unsupported(self):
+        negotiator = sparql_search.FormatNegotiator()
+        negotiator.set_unsupported("e", "json")
+        negotiator.set_unsupported("e", "tsv")
+        self.assertEqual(negotiator.choose("e", "shape"), "csv")
+        self.assertEqual(negotiator.choose("e", "shape", typed=True), "json")
+        self.assertEqual(negotiator.choose("other", "shape"), "json")
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def queue(self, scheduler, priority, endpoint):
+        """
+        Queues job without starting worker threads, so jobs are taken only by next_job
+        """
+        future = Future()
+        scheduler.queue.append((priority, next(scheduler.seq), time.monotonic(), endpoint, future, None, ()))
+        return future
+
+    def started(self, scheduler):
+        job, _ = scheduler.next_job()
+        return None if job is None else (job[0], job[3])
+
+    def test_priorities(self):
+        scheduler = sparql_search.RequestScheduler()
+        self.queue(scheduler, sparql_search.PRIORITY_BULK, "e")
+        self.queue(scheduler, sparql_search.PRIORITY_PREFETCH, "e")
+        self.queue(scheduler, sparql_search.PRIORITY_INTERACTIVE, "e")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_INTERACTIVE, "e"))
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_PREFETCH, "e"))
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_BULK, "e"))
+
+    def test_reserved_worker(self):
+        scheduler = sparql_search.RequestScheduler(workers=2)
+        self.queue(scheduler, sparql_search.PRIORITY_PREFETCH, "a")
+        self.queue(scheduler, sparql_search.PRIORITY_BULK, "b")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_PREFETCH, "a"))
+        self.assertIsNone(self.started(scheduler))
+        self.queue(scheduler, sparql_search.PRIORITY_INTERACTIVE, "c")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_INTERACTIVE, "c"))
+
+    @mock.patch.dict(sparql_search.ENDPOINT_CONCURRENCY, {"e": 2})
+    def test_reserved_endpoint_slot(self):
+        scheduler = sparql_search.RequestScheduler()
+        self.queue(scheduler, sparql_search.PRIORITY_BULK, "e")
+        self.queue(scheduler, sparql_search.PRIORITY_BULK, "e")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_BULK, "e"))
+        self.assertIsNone(self.started(scheduler))
+        self.queue(scheduler, sparql_search.PRIORITY_INTERACTIVE, "e")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_INTERACTIVE, "e"))
+        # Other endpoints are not blocked
+        self.queue(scheduler, sparql_search.PRIORITY_BULK, "f")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_BULK, "f"))
+
+    @mock.patch.dict(sparql_search.ENDPOINT_RATES, {"e": (0.01, 2)})
+    def test_reserved_token(self):
+        scheduler = sparql_search.RequestScheduler()
+        self.queue(scheduler, sparql_search.PRIORITY_BULK, "e")
+        self.queue(scheduler, sparql_search.PRIORITY_BULK, "e")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_BULK, "e"))
+        job, delay = scheduler.next_job()
+        self.assertIsNone(job)
+        self.assertGreater(delay, 0)
+        self.queue(scheduler, sparql_search.PRIORITY_INTERACTIVE, "e")
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_INTERACTIVE, "e"))
+        self.assertIsNone(self.started(scheduler))
+
+    def test_cancel_queued(self):
+        scheduler = sparql_search.RequestScheduler()
+        cancelled = self.queue(scheduler, sparql_search.PRIORITY_PREFETCH, "a")
+        other_endpoint = self.queue(scheduler, sparql_search.PRIORITY_PREFETCH, "b")
+        other_priority = self.queue(scheduler, sparql_search.PRIORITY_BULK, "a")
+        scheduler.cancel_queued(sparql_search.PRIORITY_PREFETCH, "a")
+        self.assertTrue(cancelled.cancelled())
+        self.assertFalse(other_endpoint.cancelled())
+        self.assertFalse(other_priority.cancelled())
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_PREFETCH, "b"))
+        self.assertEqual(self.started(scheduler), (sparql_search.PRIORITY_BULK, "a"))
+        stats = scheduler.get_stats()
+        self.assertEqual(stats["prefetch"]["cancelled"], 1)
+        self.assertEqual(stats["running"], {"a": 1, "b": 1})
+
+    def test_interactive_not_waiting_for_background(self):
+        scheduler = sparql_search.RequestScheduler(workers=2)
+        release = threading.Event()
+        background = [scheduler.submit(x, sparql_search.PRIORITY_BULK, release.wait, 5) for x in ("a", "b")]
+        try:
+            self.assertEqual(scheduler.submit("c", sparql_search.PRIORITY_INTERACTIVE, len, "abc").result(2), 3)
+        finally:
+            release.set()
+        self.assertTrue(all(f.result(5) for f in background))
+
+
+class TestViewHistory(unittest.TestCase):
+
+    def open(self, history, name):
+        entry = {"view": name, "data": None}
+        history.store(entry, ["x"*1000])
+        history.push(entry)
+        return entry
+
+    def test_least_recently_shown_evicted(self):
+        size = sparql_search.data_size(["x"*1000])
+        history = sparql_search.ViewHistory(budget=size*2)
+        first = self.open(history, "first")
+        second = self.open(history, "second")
+        # Going back shows the first entry again
+        history.touch(history.move(-1))
+        self.assertTrue(history.can_go_forward())
+        history.touch(history.move(1))
+        history.touch(history.move(-1))
+        self.assertIsNotNone(first["data"])
+        self.assertIsNotNone(second["data"])
+        third = {"view": "third", "data": None}
+        history.store(third, ["x"*1000])
+        self.assertIsNotNone(first["data"])
+        self.assertIsNone(second["data"])
+        self.assertEqual(history.size, size*2)
+
+    def test_push_drops_forward_entries(self):
+        history = sparql_search.ViewHistory()
+        first = self.open(history, "first")
+        second = self.open(history, "second")
+        history.move(-1)
+        third = self.open(history, "third")
+        self.assertIsNone(second["data"])
+        self.assertIs(history.peek(-1), first)
+        self.assertIs(history.peek(0), third)
+        self.assertIsNone(history.peek(1))
+        self.assertEqual(history.size, sparql_search.data_size(["x"*1000])*2)
+
+    def test_max_entries(self):
+        history = sparql_search.ViewHistory(max_entries=2)
+        first = self.open(history, "first")
+        self.open(history, "second")
+        self.open(history, "third")
+        self.assertEqual([e["view"] for e in history.entries], ["second", "third"])
+        self.assertIsNone(first["data"])
+        self.assertTrue(history.can_go_back())
+        history.move(-1)
+        self.assertFalse(history.can_go_back())
+
+    def test_current_data_kept_over_budget(self):
+        history = sparql_search.ViewHistory(budget=1)
+        first = self.open(history, "first")
+        self.assertIsNotNone(first["data"])
+        second = self.open(history, "second")
+        self.assertIsNone(first["data"])
+        self.assertIsNotNone(second["data"])
+
+
+# Rows of the stand-in export query
+EXPORT_ROWS = [({"type": "uri", "value": "urn:s"}, {"type": "uri", "value": "urn:p{}".format(i)},
+                {"type": "literal", "value": "line {}\n\"quoted\"".format(i), "xml:lang": "en"}) for i in range(25)]
+
+
+def fetch_export_rows(endpoint, mode, limit, offset, keyword, uri, dbpedia, timeout):
+    return EXPORT_ROWS[offset:offset+limit]
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "out.nt")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_nt_terms(self):
+        self.assertEqual(sparql_search.nt_term({"type": "uri", "value": "http://a/b c>"}), "<http://a/b\\u0020c\\u003E>")
+        self.assertEqual(sparql_search.nt_term({"type": "bnode", "value": "b.0"}), "_:b_0")
+        self.assertEqual(sparql_search.nt_term({"type": "literal", "value": "a\"b\\c\nd", "xml:lang": "en"}),
+                         '"a\\"b\\\\c\\nd"@en')
+        self.assertEqual(sparql_search.nt_term({"type": "typed-literal", "value": "5",
+                                                "datatype": "http://www.w3.org/2001/XMLSchema#int"}),
+                         '"5"^^<http://www.w3.org/2001/XMLSchema#int>')
+
+    def test_missing_parameters(self):
+        with self.assertRaises(ValueError):
+            sparql_search.export_results("e", self.path, "jsonl", "search")
+        with self.assertRaises(ValueError):
+            sparql_search.export_results("e", self.path, "nt", "triplets")
+        with self.assertRaises(ValueError):
+            sparql_search.export_results("e", self.path, "nt", "all")
+
+    @mock.patch("sparql_search.fetch_export_page", fetch_export_rows)
+    def test_resume(self):
+        stop = threading.Event()
+        rows, _ = sparql_search.export_results("e", self.path, "nt", "triplets", uri="urn:s", limit=10,
+                                               workers=2, progress=lambda *args: stop.set(), stop=stop)
+        self.assertEqual(rows, 10)
+        self.assertTrue(os.path.exists(self.path+".state"))
+        # Resuming with other parameters would mix two exports
+        with self.assertRaises(ValueError):
+            sparql_search.export_results("e", self.path, "nt", "triplets", uri="urn:x", limit=10, resume=True)
+        rows, written = sparql_search.export_results("e", self.path, "nt", "triplets", uri="urn:s", limit=10,
+                                                     workers=2, resume=True)
+        self.assertEqual(rows, len(EXPORT_ROWS))
+        self.assertFalse(os.path.exists(self.path+".state"))
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.assertEqual(len(data), written)
+        lines = data.decode("utf-8").splitlines()
+        self.assertEqual(len(lines), len(EXPORT_ROWS))
+        self.assertEqual(lines[12], '<urn:s> <urn:p12> "line 12\\n\\"quoted\\""@en .')
+
+
+if __name__ == "__main__":
+    unittest.main()